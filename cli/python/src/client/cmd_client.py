@@ -1,7 +1,12 @@
 #!/usr/bin/python3
+import functools
 import os
+import re
 import sys
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Union, List, Sequence
@@ -9,44 +14,66 @@ from typing import Optional, Union, List, Sequence
 import click
 
 import src.utils.logger as logger
-from src.client.device_resolver import DeviceResolver, DHCPReason
+from src.client.device_resolver import DeviceResolver, DHCPReason, DNSResolver
 from src.client.version import APP_VERSION, HASH_VERSION
 from src.executor.shell_executor import SystemHelper
 from src.executor.vpn_cmd_executor import VpnCmdExecutor
 from src.utils import about
 from src.utils.constants import ErrorCode, AppEnv
 from src.utils.downloader import download, VPNType, downloader_opt_factory, DownloaderOpt
-from src.utils.helper import FileHelper, loop_interval, JsonHelper, TextHelper, EnvHelper, NetworkHelper
+from src.utils.helper import FileHelper, loop_interval, JsonHelper, EnvHelper, NetworkHelper, cached_property
 from src.utils.opts_shared import CLI_CTX_SETTINGS, permission, verbose_opts, UnixServiceOpts, unix_service_opts, \
     dev_mode_opts
 from src.utils.opts_vpn import AuthOpts, vpn_auth_opts, ServerOpts, vpn_server_opts, VpnDirectory, vpn_dir_opts_factory
 
+VPN_CMD_RESULT_PATTERN = re.compile(r'VPN Client>.+((?:\n.+)+)')
+
+AccountSnapshot = namedtuple('AccountSnapshot', ['accounts', 'default', 'current'])
+
 
 class ClientOpts(VpnDirectory):
     VPN_ZIP = 'vpnclient.zip'
     VPN_HOME = '/app/vpnclient'
     VPN_CONFIG_FILE = 'vpn_client.config'
 
-    @property
+    @cached_property
     def config_file(self):
         return self.vpn_dir.joinpath(self.VPN_CONFIG_FILE)
 
-    @property
+    @cached_property
     def vpnclient(self):
         return self.vpn_dir.joinpath('vpnclient')
 
-    @property
-    def log_file(self):
-        return self.get_log_file(datetime.today().strftime("%Y%m%d"))
+    @cached_property
+    def vpnclient_str(self) -> str:
+        return str(self.vpnclient)
+
+    _log_date, _log_path, _log_checked_at = None, None, 0.0
 
     @property
+    def log_file(self):
+        now = time.monotonic()
+        if self._log_path is None or now - self._log_checked_at >= 60:
+            date = datetime.today().strftime("%Y%m%d")
+            if date != self._log_date:
+                self._log_date, self._log_path = date, self.get_log_file(date)
+            self._log_checked_at = now
+        return self._log_path
+
+    @cached_property
     def account_cache_file(self):
         return self.runtime_dir.joinpath('vpn.account.cache')
 
-    @property
+    @cached_property
     def service_cache_file(self):
         return self.runtime_dir.joinpath('vpn.service.cache')
 
+    def reload(self, vpn_dir):
+        for prop in ('config_file', 'vpnclient', 'vpnclient_str', 'account_cache_file', 'service_cache_file'):
+            self.__dict__.pop(prop, None)
+        self._log_date, self._log_path, self._log_checked_at = None, None, 0.0
+        return super().reload(vpn_dir)
+
     def get_log_file(self, date):
         return os.path.join(self.vpn_dir, 'client_log', f'client_{date}.log')
 
@@ -67,6 +94,7 @@ class ClientOpts(VpnDirectory):
         return nic.startswith('vpn_')
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def vpn_service_name() -> str:
         binary = EnvHelper.binary_name()
         brand = binary.split('-', 1)[0] if binary else AppEnv.BRAND
@@ -89,9 +117,40 @@ class AccountInfo:
 class AccountStorage:
     def __init__(self, account_file: Union[str, Path]):
         self._account_file = account_file
+        self._cache = None
+        self._mtime = None
+        self._deferred = False
+        self._dirty = False
 
     def _load(self):
-        return JsonHelper.read(self._account_file, strict=False)
+        mtime = self._stat_mtime()
+        if self._cache is None or mtime is None or mtime != self._mtime:
+            self._cache = JsonHelper.read(self._account_file, strict=False)
+            self._mtime = mtime
+        return self._cache
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(str(self._account_file)).st_mtime_ns
+        except OSError:
+            return None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Defer every `_dump` write inside the block then flush once on exit
+        """
+        if self._deferred:
+            yield self
+            return
+        self._deferred = True
+        try:
+            yield self
+            if self._dirty:
+                self._write(self._cache)
+        finally:
+            self._deferred = False
+            self._dirty = False
 
     def create_or_update(self, account: AccountInfo, _connect: bool):
         data = self._load()
@@ -103,13 +162,15 @@ class AccountStorage:
 
     def list(self) -> List[AccountInfo]:
         data = self._load()
-        return [self._to_account_info(acc, data) for acc in self._accounts(data).values()]
+        _default, _current = self.get_default(data), self.get_current(data)
+        return [self._to_account_info(acc, _default, _current) for acc in self._accounts(data).values()]
 
     def find(self, account: str, data=None) -> Optional[AccountInfo]:
         if not account:
             return None
-        data = data or self._load()
-        return next((self._to_account_info(acc, data) for k, acc in self._accounts(data).items() if k == account), None)
+        data = data if data is not None else self._load()
+        acc = self._accounts(data).get(account, None)
+        return self._to_account_info(acc, self.get_default(data), self.get_current(data)) if acc else None
 
     def remove(self, accounts: Union[str, List[str]]) -> (bool, bool):
         data = self._load()
@@ -132,6 +193,10 @@ class AccountStorage:
     def set_current(self, account):
         self._dump(_current=account)
 
+    def snapshot(self) -> AccountSnapshot:
+        data = self._load()
+        return AccountSnapshot(self._accounts(data), self.get_default(data), self.get_current(data))
+
     def get_default(self, data=None, info=False) -> Optional[Union[str, AccountInfo]]:
         return self._lookup('_default', data, info)
 
@@ -139,24 +204,31 @@ class AccountStorage:
         return self._lookup('_current', data, info)
 
     def _accounts(self, data=None) -> dict:
-        return (data or self._load()).get('_accounts', {})
+        return (data if data is not None else self._load()).get('_accounts', {})
 
     def _lookup(self, key, data=None, info=False) -> Optional[Union[str, AccountInfo]]:
-        load = data or self._load()
+        load = data if data is not None else self._load()
         acc = load.get(key, None)
-        return acc if not info else self.find(acc, data)
+        return acc if not info else self.find(acc, load)
 
-    def _to_account_info(self, acc, data=None) -> AccountInfo:
-        acc['is_default'] = acc['account'] == self.get_default(data)
-        acc['is_current'] = acc['account'] == self.get_current(data)
-        return AccountInfo(**acc)
+    def _to_account_info(self, acc, default: Optional[str], current: Optional[str]) -> AccountInfo:
+        return AccountInfo(**{**acc, 'is_default': acc['account'] == default,
+                              'is_current': acc['account'] == current})
 
     def _dump(self, _accounts: dict = None, _current: str = None, _default: str = None, data=None):
-        data = data or self._load()
+        data = data if data is not None else self._load()
         data['_accounts'] = self._accounts(data) if _accounts is None else _accounts
         data['_current'] = self.get_current(data) if _current is None else _current
         data['_default'] = self.get_default(data) if _default is None else _default
+        self._cache = data
+        if self._deferred:
+            self._dirty = True
+            return
+        self._write(data)
+
+    def _write(self, data):
         JsonHelper.dump(self._account_file, data)
+        self._mtime = self._stat_mtime()
 
 
 class VPNPIDHandler:
@@ -183,16 +255,20 @@ class VPNPIDHandler:
         return next((pid for pid in map(lambda x: self._check_pid(x, log_lvl), self._pid_files(log_lvl)) if pid), 0)
 
     def _pid_files(self, log_lvl=logger.TRACE) -> list:
-        files = FileHelper.find_files(self.opts.vpn_dir, '.pid_*')
-        logger.log(log_lvl, f'PID files [{",".join(files)}]')
+        try:
+            files = [e.path for e in os.scandir(self.opts.vpn_dir) if e.name.startswith('.pid_') and e.is_file()]
+        except OSError:
+            files = []
+        if logger.is_enabled(log_lvl):
+            logger.log(log_lvl, f'PID files [{",".join(files)}]')
         return files
 
     @staticmethod
     def _check_pid(pid_file: str, log_lvl=logger.TRACE) -> int:
         try:
             logger.log(log_lvl, f'Read PID file {pid_file}')
-            pid = FileHelper.read_file_by_line(pid_file)
-            pid = int(pid)
+            with open(pid_file, 'rb') as fp:
+                pid = int(fp.read().strip() or 0)
             if pid and pid > 0 and SystemHelper.is_pid_exists(pid):
                 return pid
         except Exception as _:
@@ -205,10 +281,11 @@ class VPNClientExecutor(VpnCmdExecutor):
     def __init__(self, vpn_opts: ClientOpts, adhoc_task=False):
         super().__init__(vpn_opts)
         self.storage = AccountStorage(self.opts.account_cache_file)
-        self._device = DeviceResolver()
+        self._device = DeviceResolver().probe(ClientOpts.resource_dir(), self.opts.runtime_dir)
         self.pid_handler = VPNPIDHandler(self.opts)
         self.adhoc_task = adhoc_task
         self._prev_is_run = False
+        self._svc_opts = None
 
     def pre_exec(self, silent=False, log_lvl=logger.DEBUG, **kwargs):
         logger.log(log_lvl, 'Start VPN Client if not yet running...')
@@ -217,11 +294,13 @@ class VPNClientExecutor(VpnCmdExecutor):
         if self.pid_handler.is_running():
             self._prev_is_run = True
             return
-        SystemHelper.exec_command(f'{self.opts.vpnclient} start', log_lvl=logger.down_lvl(log_lvl))
-        time.sleep(1)
-        if not self.pid_handler.is_running(log_lvl=logger.down_lvl(log_lvl)):
-            logger.error('Unable start VPN Client')
-            sys.exit(ErrorCode.VPN_START_FAILED)
+        SystemHelper.exec_command(self.opts.vpnclient_str + ' start', log_lvl=logger.down_lvl(log_lvl))
+        for _ in range(20):
+            if self.pid_handler.is_running(log_lvl=logger.down_lvl(log_lvl)):
+                return
+            time.sleep(0.05)
+        logger.error('Unable start VPN Client')
+        sys.exit(ErrorCode.VPN_START_FAILED)
 
     def post_exec(self, silent=False, log_lvl=logger.DEBUG, **kwargs):
         logger.log(log_lvl, 'Stop VPN Client if applicable...')
@@ -231,7 +310,7 @@ class VPNClientExecutor(VpnCmdExecutor):
             return
         lvl = logger.down_lvl(log_lvl)
         if self.pid_handler.is_running(log_lvl=lvl):
-            SystemHelper.exec_command(f'{self.opts.vpnclient} stop', silent=silent, log_lvl=lvl)
+            SystemHelper.exec_command(self.opts.vpnclient_str + ' stop', silent=silent, log_lvl=lvl)
             self._cleanup_zombie_vpn(1, log_lvl=lvl)
             self.pid_handler.cleanup()
 
@@ -254,12 +333,20 @@ class VPNClientExecutor(VpnCmdExecutor):
         self._device = self.device.probe(ClientOpts.resource_dir(), self.opts.runtime_dir, log_lvl, silent)
         return self
 
+    @staticmethod
+    def parse_session_status(output: str) -> str:
+        """Pull the 'Session Status' value out of an AccountStatusGet output in one pass"""
+        for line in (output or '').splitlines():
+            if line.startswith('Session Status'):
+                return line.split('|', 2)[1].strip()
+        return ''
+
     def get_vpn_status(self, vpn_acc: str) -> dict:
         if not vpn_acc:
             return {'connected': False}
         try:
             ss = self.exec_command('AccountStatusGet', params=vpn_acc, silent=True, log_lvl=logger.DEBUG)
-            ss_msg = TextHelper.awk(next(iter(TextHelper.grep(ss, r'Session Status.+')), None), sep='|', pos=1).strip()
+            ss_msg = self.parse_session_status(ss)
             return {'connected': ss_msg == 'Connection Completed (Session Established)', 'msg': ss_msg}
         except Exception as err:
             logger.debug(f'Something wrong when getting VPN status. Error[{err}]')
@@ -315,16 +402,17 @@ class VPNClientExecutor(VpnCmdExecutor):
     def do_delete(self, accounts: Sequence[str], log_lvl: int = logger.INFO, silent: bool = True, force_stop=False):
         cur_acc = self.storage.get_current()
         is_disable, is_stop = False, force_stop or cur_acc is None or cur_acc == ''
-        for acc in accounts:
-            logger.log(log_lvl, f'Delete VPN account [{acc}]...')
-            is_default, is_current = self.storage.remove(acc)
-            is_stop = is_current or is_stop
-            is_disable = is_default or is_disable
-            commands = ['AccountDisconnect', 'AccountDelete', 'NicDelete']
-            if is_default:
-                commands.insert(1, 'AccountStartupRemove')
-                self.storage.set_default('')
-            self.exec_command(commands, acc, silent, log_lvl)
+        with self.storage.transaction():
+            for acc in accounts:
+                logger.log(log_lvl, f'Delete VPN account [{acc}]...')
+                is_default, is_current = self.storage.remove(acc)
+                is_stop = is_current or is_stop
+                is_disable = is_default or is_disable
+                commands = ['AccountDisconnect', 'AccountDelete', 'NicDelete']
+                if is_default:
+                    commands.insert(1, 'AccountStartupRemove')
+                    self.storage.set_default('')
+                self.exec_command(commands, acc, silent, log_lvl)
         self.shutdown_vpn_service(is_stop=is_stop, is_disable=is_disable, log_lvl=log_lvl)
 
     def do_disconnect(self, accounts: Sequence[str], must_disable_service=False, log_lvl: int = logger.INFO,
@@ -333,10 +421,15 @@ class VPNClientExecutor(VpnCmdExecutor):
         is_stop = cur_acc is None or cur_acc == ''
         for acc in accounts:
             logger.log(log_lvl, f'Disconnect VPN account [{acc}]...')
-            self.exec_command('AccountDisconnect', params=acc, log_lvl=logger.down_lvl(log_lvl), silent=silent)
-            self.device.ip_resolver.release_ip(acc, self.opts.account_to_nic(acc))
-            self.device.ip_resolver.cleanup_zombie(f'--no-pid.* {self.opts.account_to_nic(acc)}')
             is_stop = acc == cur_acc or is_stop
+        if accounts:
+            self.exec_batch([f'AccountDisconnect {acc}' for acc in accounts], log_lvl=logger.down_lvl(log_lvl),
+                            silent=silent)
+            nics = [self.opts.account_to_nic(acc) for acc in accounts]
+            with ThreadPoolExecutor(max_workers=min(len(accounts), 8)) as pool:
+                for _ in pool.map(self.device.ip_resolver.release_ip, accounts, nics):
+                    pass
+            self.device.ip_resolver.cleanup_zombie(*[f'--no-pid.* {nic}' for nic in nics])
         if is_stop:
             self.shutdown_vpn_service(is_stop=True, is_disable=must_disable_service, log_lvl=log_lvl)
 
@@ -404,10 +497,9 @@ class VPNClientExecutor(VpnCmdExecutor):
         FileHelper.mkdirs(backup_dir)
         FileHelper.copy(self.opts.config_file, backup_dir, force=True)
         FileHelper.copy(self.opts.runtime_dir, backup_dir.joinpath(self.opts.RUNTIME_FOLDER), force=True)
-        default_acc = self.storage.get_default()
-        current_acc = self.storage.get_current()
+        ss = self.storage.snapshot()
         svc_opt = self._standard_service_opt()
-        return default_acc, current_acc, svc_opt, backup_dir
+        return ss.default, ss.current, svc_opt, backup_dir
 
     def restore_config(self, backup_dir: Path, keep_backup: bool):
         logger.info(f'Restore VPN configuration [{backup_dir}] to [{self.opts.vpn_dir}]...')
@@ -416,9 +508,13 @@ class VPNClientExecutor(VpnCmdExecutor):
         FileHelper.rm(backup_dir, force=not keep_backup)
 
     def _cleanup_zombie_vpn(self, delay=1, log_lvl=logger.DEBUG):
-        time.sleep(delay)
         logger.log(log_lvl, 'Cleanup the VPN zombie processes...')
-        SystemHelper.kill_by_process(f'{self.vpn_dir}/vpnclient execsvc', silent=True, log_lvl=logger.down_lvl(log_lvl))
+        process = self.opts.vpnclient_str + ' execsvc'
+        for _ in range(max(int(delay * 20), 1)):
+            if not SystemHelper.pid_by_process(process):
+                break
+            time.sleep(0.05)
+        SystemHelper.kill_by_process(process, silent=True, log_lvl=logger.down_lvl(log_lvl))
         self.device.ip_resolver.cleanup_zombie(f'vpn_')
 
     def _is_install(self) -> bool:
@@ -429,22 +525,27 @@ class VPNClientExecutor(VpnCmdExecutor):
                f'Use "{cmd} uninstall -f" then try reinstall by "{cmd} install"'
 
     def _optimize_command_result(self, output):
-        r = TextHelper.grep(output, r'VPN Client>.+((?:\n.+)+)')
+        r = VPN_CMD_RESULT_PATTERN.findall(output or '')
         return ''.join(r).replace('The command completed successfully.', '').strip()
 
     def _dump_cache_service(self, svc_opts: UnixServiceOpts):
         JsonHelper.dump(self.opts.service_cache_file, svc_opts)
+        self._svc_opts = svc_opts
 
     def _standard_service_opt(self, svc_opts: UnixServiceOpts = None) -> UnixServiceOpts:
         if svc_opts:
             return UnixServiceOpts(svc_opts.service_dir or self.device.unix_service.standard_service_dir,
                                    svc_opts.service_name)
+        if self._svc_opts:
+            return self._svc_opts
         try:
             data = JsonHelper.read(self.opts.service_cache_file)
-            return UnixServiceOpts(data.get('service_dir') or self.device.unix_service.standard_service_dir,
-                                   data.get('service_name'))
+            self._svc_opts = UnixServiceOpts(data.get('service_dir') or self.device.unix_service.standard_service_dir,
+                                             data.get('service_name'))
         except FileNotFoundError:
-            return UnixServiceOpts(self.device.unix_service.standard_service_dir, ClientOpts.vpn_service_name())
+            self._svc_opts = UnixServiceOpts(self.device.unix_service.standard_service_dir,
+                                             ClientOpts.vpn_service_name())
+        return self._svc_opts
 
     def tweak_network_per_account(self, account: str, hostname: str):
         # self.device.ip_resolver.create_config(account, {'{{HOST_NAME}}': hostname})
@@ -570,15 +671,15 @@ def add(vpn_opts: ClientOpts, server_opts: ServerOpts, auth_opts: AuthOpts, acco
     acc = AccountInfo(server_opts.hub, account, hostname, is_default)
     logger.info(f'Setup VPN Client with VPN account [{acc.account}]...')
     executor.tweak_network_per_account(acc.account, hostname)
-    setup_cmd = {
-        'AccountCreate': f'{acc.account} /SERVER:{server_opts.server} /HUB:{acc.hub} /USERNAME:{auth_opts.user} /NICNAME:{acc.account}'
-    }
-    setup_cmd = {**setup_cmd, **auth_opts.setup(acc.account)}
-    setup_cmd = setup_cmd if not is_connect else {**setup_cmd, **{'AccountConnect': acc.account}}
+    setup_cmds = [f'AccountCreate {acc.account} /SERVER:{server_opts.server} /HUB:{acc.hub} ' +
+                  f'/USERNAME:{auth_opts.user} /NICNAME:{acc.account}']
+    setup_cmds += [f'{c} {p}' for c, p in auth_opts.setup(acc.account).items()]
+    if is_connect:
+        setup_cmds.append(f'AccountConnect {acc.account}')
     if acc.is_default or is_connect:
         executor.do_disconnect_current(log_lvl=logger.DEBUG)
     executor.exec_command(['NicCreate', 'AccountDisconnect', 'AccountDelete'], acc.account, silent=True)
-    executor.exec_command(setup_cmd)
+    executor.exec_batch(setup_cmds)
     executor.storage.create_or_update(acc, _connect=is_connect)
     if acc.is_default:
         executor.do_switch_default_acc(acc.account)
@@ -628,12 +729,12 @@ def set_default(vpn_opts: ClientOpts, account: str, is_connect: bool):
 @permission
 def connect(vpn_opts: ClientOpts, account: str):
     executor = VPNClientExecutor(vpn_opts).require_install().probe(log_lvl=logger.INFO)
-    def_acc = executor.storage.get_default()
-    if account and def_acc == account:
+    ss = executor.storage.snapshot()
+    if account and ss.default == account:
         executor.do_disconnect_current(log_lvl=logger.DEBUG)
         executor.lease_vpn_service(is_enable=True, is_restart=True, is_lease_ip=False)
     else:
-        cur_acc = executor.storage.get_current()
+        cur_acc = ss.current
         executor.do_disconnect([account, cur_acc] if cur_acc else [account], log_lvl=logger.DEBUG)
         executor.do_connect(account, log_lvl=logger.INFO)
     logger.done()
@@ -670,24 +771,30 @@ def status(vpn_opts: ClientOpts, is_json: bool, domains: list):
     installed = executor.is_installed(silent=True)
     vpn_service = executor.vpn_service
     vpn_acc = executor.storage.get_current() or None
-    svc_status = executor.device.unix_service.status(vpn_service)
     dns_status = True
-    ss = {
-        'app_state': installed, 'app_state_msg': 'Installed' if installed else 'Not yet installed',
-        'app_dir': executor.opts.vpn_dir if installed else None,
-        'service': executor.vpn_service, 'service_status': svc_status.value,
-        'vpn_pid': executor.pid_handler.current_pid, 'vpn_account': vpn_acc,
-        'vpn_status': False, 'vpn_status_msg': None, 'vpn_ip': None
-    }
-    if vpn_acc:
-        vpn_ss = executor.get_vpn_status(vpn_acc)
-        ss = {**ss, **{'vpn_status_msg': vpn_ss.get('msg'), 'vpn_status': vpn_ss.get('connected')},
-              'vpn_ip': executor.device.ip_resolver.get_vpn_ip(ClientOpts.account_to_nic(vpn_acc))}
-    if domains:
-        _domains = {domain: NetworkHelper.lookup_ipv4_by_domain(domain) for domain in domains}
-        dns_status = next(filter(lambda r: r[1] is False, _domains.values()), ('', True))[1]
-        ss['domains'] = {k: v[0] for k, v in _domains.items()}
-        ss['dns_status'] = dns_status
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        svc_status_fut = pool.submit(executor.device.unix_service.status, vpn_service)
+        vpn_ss_fut = pool.submit(executor.get_vpn_status, vpn_acc) if vpn_acc else None
+        vpn_ip_fut = pool.submit(executor.device.ip_resolver.get_vpn_ip,
+                                 ClientOpts.account_to_nic(vpn_acc)) if vpn_acc else None
+        domain_futs = [(domain, pool.submit(NetworkHelper.lookup_ipv4_by_domain, domain)) for domain in domains]
+        svc_status = svc_status_fut.result()
+        ss = {
+            'app_state': installed, 'app_state_msg': 'Installed' if installed else 'Not yet installed',
+            'app_dir': executor.opts.vpn_dir if installed else None,
+            'service': executor.vpn_service, 'service_status': svc_status.value,
+            'vpn_pid': executor.pid_handler.current_pid, 'vpn_account': vpn_acc,
+            'vpn_status': False, 'vpn_status_msg': None, 'vpn_ip': None
+        }
+        if vpn_acc:
+            vpn_ss = vpn_ss_fut.result()
+            ss = {**ss, **{'vpn_status_msg': vpn_ss.get('msg'), 'vpn_status': vpn_ss.get('connected')},
+                  'vpn_ip': vpn_ip_fut.result()}
+        if domains:
+            _domains = [(domain, fut.result()) for domain, fut in domain_futs]
+            dns_status = not any(ok is False for _, (_, ok) in _domains)
+            ss['domains'] = {domain: ip for domain, (ip, _) in _domains}
+            ss['dns_status'] = dns_status
     if is_json:
         print(JsonHelper.to_json(ss))
     else:
@@ -712,8 +819,8 @@ def status(vpn_opts: ClientOpts, is_json: bool, domains: list):
 @permission
 def add_trust_server(vpn_opts: ClientOpts, account: str, cert_key: str):
     logger.info("Enable Trust VPN Server on VPN client...")
-    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().probe().exec_command(
-        {'AccountServerCertSet': f'{account} /LOADCERT:{cert_key}', 'AccountServerCertEnable': account})
+    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().exec_batch(
+        [f'AccountServerCertSet {account} /LOADCERT:{cert_key}', f'AccountServerCertEnable {account}'])
     logger.done()
 
 
@@ -723,8 +830,7 @@ def add_trust_server(vpn_opts: ClientOpts, account: str, cert_key: str):
 @verbose_opts
 @permission
 def list_account(vpn_opts: ClientOpts):
-    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().probe().exec_command('AccountList',
-                                                                                        log_lvl=logger.INFO)
+    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().exec_command('AccountList', log_lvl=logger.INFO)
 
 
 @cli.command(name='detail', help='Get detail VPN configuration and status by one or many accounts')
@@ -737,8 +843,8 @@ def detail(vpn_opts: ClientOpts, accounts):
     if accounts is None or len(accounts) == 0:
         logger.error('Must provide at least account')
         sys.exit(ErrorCode.INVALID_ARGUMENT)
-    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().probe().exec_command('AccountGet', params=accounts,
-                                                                                        log_lvl=logger.INFO)
+    VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().exec_command('AccountGet', params=accounts,
+                                                                                log_lvl=logger.INFO)
 
 
 @cli.command(name='log', help='Get VPN log')
@@ -813,6 +919,13 @@ def __dns(vpn_opts: ClientOpts, nic: str, reason: str, new_nameservers: str, old
     if not vpn_opts.is_vpn_nic(nic):
         logger.warn(f'NIC[{nic}] does not belong to VPN service')
         sys.exit(0)
+    if _reason.is_ignore():
+        logger.info(f'Skip DNS discovery on [{reason}]')
+        sys.exit(0)
+    if _reason is DHCPReason.RENEW and new_nameservers == old_nameservers and \
+            FileHelper.is_readable(vpn_opts.runtime_dir.joinpath(DNSResolver.VPN_NAMESERVER_HOOK_CFG)):
+        logger.info(f'Skip DNS discovery on [{reason}] without nameserver change')
+        sys.exit(0)
     executor = VPNClientExecutor(vpn_opts, adhoc_task=True).require_install().probe(silent=True, log_lvl=logger.INFO)
     current = executor.storage.get_current(info=True)
     if not current:
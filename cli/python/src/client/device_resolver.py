@@ -1,7 +1,10 @@
-import fileinput
+import fcntl
+import mmap
 import os
 import re
 import shutil
+import socket
+import struct
 import sys
 import time
 from abc import ABC, abstractmethod
@@ -15,7 +18,7 @@ import netifaces
 import src.utils.logger as logger
 from src.executor.shell_executor import SystemHelper
 from src.utils.constants import ErrorCode
-from src.utils.helper import FileHelper, TextHelper
+from src.utils.helper import FileHelper, JsonHelper
 from src.utils.opts_shared import UnixServiceOpts
 
 
@@ -28,8 +31,7 @@ class ServiceStatus(Enum):
 
     @staticmethod
     def parse(status: str):
-        status_ = [e for e in list(ServiceStatus) if e.value == status]
-        return status_[0] if len(status_) else ServiceStatus.UNKNOWN
+        return STATUS_BY_VALUE.get(status, ServiceStatus.UNKNOWN)
 
     def is_running(self):
         return self is ServiceStatus.RUNNING
@@ -38,6 +40,9 @@ class ServiceStatus(Enum):
         return self in [ServiceStatus.RUNNING, ServiceStatus.EXITED, ServiceStatus.WAITING]
 
 
+STATUS_BY_VALUE = {e.value: e for e in ServiceStatus}
+
+
 class UnixServiceType(Enum):
     SYSTEMD = 'systemd'
     PROCD = 'procd'
@@ -126,13 +131,18 @@ class DHCPReason(Enum):
     TIMEOUT = 12
 
     def is_release(self):
-        return self in [DHCPReason.RELEASE, DHCPReason.STOP, DHCPReason.FAIL, DHCPReason.EXPIRE]
+        return self in RELEASE_REASONS
 
     def is_ignore(self):
-        return self in [DHCPReason.MEDIUM, DHCPReason.PREINIT]
+        return self in IGNORE_REASONS
 
     def is_unreachable(self):
-        return self in [DHCPReason.NBI, DHCPReason.TIMEOUT]
+        return self in UNREACHABLE_REASONS
+
+
+RELEASE_REASONS = frozenset({DHCPReason.RELEASE, DHCPReason.STOP, DHCPReason.FAIL, DHCPReason.EXPIRE})
+IGNORE_REASONS = frozenset({DHCPReason.MEDIUM, DHCPReason.PREINIT})
+UNREACHABLE_REASONS = frozenset({DHCPReason.NBI, DHCPReason.TIMEOUT})
 
 
 class DNSCompatibleMode(Enum):
@@ -268,11 +278,15 @@ class MockDNSFlavour(DNSFlavour):
         super().__init__(None, None, None)
 
 
+DNSMASQ_RESOLV_PATTERN = re.compile(r'^dnsmasq_resolv=(.+)$', re.MULTILINE)
+
+
 class OpenResolvFlavour(DNSFlavour):
 
     def adapt_dnsmasq(self, origin_resolv_conf: Path, vpn_service: str) -> Optional[Path]:
         content = FileHelper.read_file_by_line(self.config.main_cfg)
-        resolv = TextHelper.awk(next(iter(TextHelper.grep(content, r'dnsmasq_resolv=.+')), None), sep='=', pos=1)
+        matched = DNSMASQ_RESOLV_PATTERN.search(content) if content else None
+        resolv = matched.group(1).strip() if matched else None
         return Path(resolv or self.config.runtime_resolv)
 
 
@@ -304,16 +318,27 @@ class NetworkManagerFlavour(DNSFlavour):
 
 class ConnmanFlavour(DNSFlavour):
 
+    BLACKLIST_PATTERN = re.compile(r'^(NetworkInterfaceBlacklist\s*=.*)$', re.IGNORECASE | re.MULTILINE)
+    BLACKLIST_PATTERN_BYTES = re.compile(rb'^(NetworkInterfaceBlacklist\s*=.*)$', re.IGNORECASE | re.MULTILINE)
+
     def tweak_per_nic(self, nic: str):
-        restart = False
-        with fileinput.FileInput("/etc/connman/main.conf", inplace=True, backup='.bak') as f:
-            for line in f:
-                if re.match(r"^NetworkInterfaceBlacklist\s*=\s*", line, re.IGNORECASE) and nic not in line:
-                    restart = True
-                    print(line.strip() + "," + nic)
-                else:
-                    print(line, end='')
-        return restart
+        conf = Path(self.config.main_cfg)
+        try:
+            with open(conf, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                matched = self.BLACKLIST_PATTERN_BYTES.search(mm)
+                if matched and nic.encode() in matched.group(1):
+                    return False
+                data = bytes(mm).decode()
+        except ValueError:
+            data = ''
+        except OSError:
+            return False
+        tweaked = self.BLACKLIST_PATTERN.sub(
+            lambda m: m.group(1) if nic in m.group(1) else m.group(1).strip() + ',' + nic, data)
+        if tweaked == data:
+            return False
+        conf.write_text(tweaked)
+        return True
 
     def adapt_dnsmasq(self, origin_resolv_conf: Path, vpn_service: str) -> Optional[Path]:
         return FileHelper.get_target_link(origin_resolv_conf) or self.config.runtime_resolv if \
@@ -370,8 +395,9 @@ class DNSMasqFlavour(DNSFlavour):
         logger.debug(f'Symlink [dnsmasq] VPN nameserver runtime configuration [{vpn_nameserver_hook_conf}]...')
         FileHelper.create_symlink(vpn_nameserver_hook_conf, self._dnsmasq_vpn_hook_cfg, force=True)
         logger.info(f'Generate System DNS config file from VPN service...')
-        FileHelper.write_file(vpn_resolv_conf, self.__dnsmasq_resolv(vpn_service), mode=0o0644)
-        FileHelper.create_symlink(vpn_resolv_conf, DNSResolver.DNS_SYSTEM_FILE, force=True)
+        resolv_content = self.__dnsmasq_resolv(vpn_service)
+        FileHelper.write_file(vpn_resolv_conf, resolv_content, mode=0o0644)
+        self.__write_if_changed(DNSResolver.DNS_SYSTEM_FILE, resolv_content, mode=0o0644)
         self.service.enable(self.config.identity)
 
     def adapt_dnsmasq(self, origin_resolv_conf: Path, vpn_service: str) -> Optional[Path]:
@@ -387,8 +413,18 @@ class DNSMasqFlavour(DNSFlavour):
     def update_hook(self, reason: DHCPReason, priv_root_dns: str, nameservers: list, vpn_nameserver_hook_conf: Path):
         logger.info(f'Update VPN DNS config file on [{reason.name}][{priv_root_dns}] with nameservers {nameservers}...')
         servers = '\n'.join([f'server=/{priv_root_dns}/{ns}' for ns in nameservers])
-        FileHelper.write_file(vpn_nameserver_hook_conf, mode=0o644,
-                              content=f'### Generated at [{datetime.now().isoformat()}]\n{servers}\n')
+        self.__write_if_changed(vpn_nameserver_hook_conf, mode=0o644,
+                                content=f'### Generated at [{datetime.now().isoformat()}]\n{servers}\n')
+
+    @staticmethod
+    def __write_if_changed(path: Union[str, Path], content: str, mode: int):
+        """Atomically replace the given config only when its effective (non-comment) content changes"""
+        payload = [ln for ln in content.splitlines() if not ln.startswith('#')]
+        current = FileHelper.read_file_by_line(path)
+        if current is not None and [ln for ln in current.splitlines() if not ln.startswith('#')] == payload:
+            logger.debug(f'Skip re-generating [{path}]: content is unchanged')
+            return
+        FileHelper.write_file_atomic(path, content, mode=mode)
 
     def reset_hook(self, vpn_nameserver_hook_conf: Path):
         logger.info(f'Reset VPN DNS config file...')
@@ -516,6 +552,7 @@ class DNSResolver(AppConvention):
     VPN_DNS_RESOLV_CFG = 'resolv.vpn.conf'
     VPN_NAMESERVER_HOOK_CFG = 'vpn-runtime-nameserver.conf'
     CONNMAN_DHCP = 'connman-dhcp'
+    DNS_PROBE_CACHE = 'dns.probe.cache'
 
     def __init__(self, resource_dir: Union[str, Path], runtime_dir: Union[str, Path], unix_service: UnixService,
                  log_lvl: int = logger.DEBUG, silent: bool = True):
@@ -525,8 +562,11 @@ class DNSResolver(AppConvention):
         self.vpn_resolv_cfg = DNSResolver.DNS_SYSTEM_FILE.parent.joinpath(DNSResolver.VPN_DNS_RESOLV_CFG)
         self.vpn_hook_cfg = self.runtime_dir.joinpath(self.VPN_NAMESERVER_HOOK_CFG)
         self.connman_dhcp = self.runtime_dir.joinpath(self.CONNMAN_DHCP)
+        self.probe_cache = self.runtime_dir.joinpath(self.DNS_PROBE_CACHE)
 
-    def probe(self) -> 'DNSResolver':
+    def probe(self, force=False) -> 'DNSResolver':
+        if not force and self.__load_probe_cache():
+            return self
         self.kind = next(
             (t for t in DNSResolverType.as_services() if self.service.status(t.config.identity).is_enabled()),
             self.kind)
@@ -538,8 +578,32 @@ class DNSResolver(AppConvention):
             dnsmasq_name = DNSResolverType.DNSMASQ.config.identity
             self._is_dnsmasq = self.service.status(dnsmasq_name).is_enabled() or shutil.which(dnsmasq_name) is not None
         logger.debug(f'Current DNS resolver [{self.kind.name}], is dnsmasq available [{self._is_dnsmasq}]')
+        self.__dump_probe_cache()
         return self
 
+    @staticmethod
+    def __boot_id() -> str:
+        return (FileHelper.read_file_by_line('/proc/sys/kernel/random/boot_id', fallback_if_not_exists='') or '').strip()
+
+    def __load_probe_cache(self) -> bool:
+        """The installed resolver cannot change within one boot, so reuse a probe result cached for this boot id"""
+        cache = JsonHelper.read(self.probe_cache, strict=False)
+        boot_id = self.__boot_id()
+        if not boot_id or not cache or cache.get('boot_id') != boot_id:
+            return False
+        kind = next((t for t in DNSResolverType if t.name == cache.get('kind')), None)
+        if not kind or kind.is_unknown():
+            return False
+        self.kind, self._is_dnsmasq = kind, bool(cache.get('dnsmasq'))
+        logger.debug(f'Current DNS resolver [{self.kind.name}], is dnsmasq available [{self._is_dnsmasq}] (cached)')
+        return True
+
+    def __dump_probe_cache(self):
+        boot_id = self.__boot_id()
+        if not boot_id or self.kind.is_unknown() or not FileHelper.is_dir(self.runtime_dir):
+            return
+        JsonHelper.dump(self.probe_cache, {'boot_id': boot_id, 'kind': self.kind.name, 'dnsmasq': self._is_dnsmasq})
+
     def is_connman(self) -> bool:
         return self.kind is DNSResolverType.CONNMAN
 
@@ -659,20 +723,32 @@ class IPResolver(AppConvention):
         SystemHelper.exec_command(f'{self._refresh_all_ip_opt()}', silent=silent or self.silent,
                                   log_lvl=logger.down_lvl(self.log_lvl))
 
-    def cleanup_zombie(self, process):
+    def cleanup_zombie(self, *processes):
         logger.decrease(self.log_lvl, 'Cleanup the IP lease zombie processes...')
-        SystemHelper.kill_by_process(f'{self.ip_tool}.*{process}.*', silent=True, log_lvl=self.log_lvl)
+        pids = SystemHelper.pid_by_patterns([f'{self.ip_tool}.*{p}.*' for p in processes])
+        SystemHelper.kill_by_pid(pids, silent=True, log_lvl=logger.down_lvl(self.log_lvl))
+
+    SIOCGIFADDR = 0x8915
 
     def get_vpn_ip(self, nic: str, lenient=True):
         try:
             logger.log(self.log_lvl, f'Query VPN IPv4 on {nic}...')
-            return netifaces.ifaddresses(nic)[netifaces.AF_INET]
+            return self.__query_ip_by_ioctl(nic) or netifaces.ifaddresses(nic)[netifaces.AF_INET]
         except Exception as err:
             if lenient:
                 logger.debug(f'Not found VPN IP {nic}. Error: {err}')
                 return None
             raise err
 
+    def __query_ip_by_ioctl(self, nic: str) -> Optional[list]:
+        """Single SIOCGIFADDR ioctl against the given NIC instead of enumerating every interface"""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                packed = fcntl.ioctl(sock.fileno(), self.SIOCGIFADDR, struct.pack('256s', nic[:15].encode()))
+            return [{'addr': socket.inet_ntoa(packed[20:24])}]
+        except OSError:
+            return None
+
     def _to_config_file(self, suffix):
         return self.runtime_dir.joinpath(f'vpn_dhclient.{suffix}.conf')
 
@@ -702,7 +778,9 @@ class Systemd(UnixService):
 
     @staticmethod
     def factory(resource_dir: Union[str, Path], runtime_dir: Union[str, Path]) -> 'UnixService':
-        if SystemHelper.verify_command(f'pidof {UnixServiceType.SYSTEMD.value}'):
+        init = SystemHelper.init_process_name()
+        if init == UnixServiceType.SYSTEMD.value or \
+                (not init and SystemHelper.verify_command(f'pidof {UnixServiceType.SYSTEMD.value}')):
             return Systemd(resource_dir=resource_dir, runtime_dir=runtime_dir)
         return None
 
@@ -715,7 +793,7 @@ class Systemd(UnixService):
         return '/etc/systemd/system'
 
     def create(self, svc_opts: UnixServiceOpts, replacements: dict, auto_startup: bool = False):
-        service_fqn = self.to_service_fqn(svc_opts.service_dir, svc_opts.service_name)
+        service_fqn = svc_opts.service_fqn
         logger.info(f'Add new service [{svc_opts.service_name}] in [{service_fqn}]...')
         FileHelper.copy(self.resource_dir.joinpath(Systemd.SERVICE_FILE_TMPL), service_fqn, force=True)
         FileHelper.replace_in_file(service_fqn, replacements, backup='')
@@ -725,13 +803,10 @@ class Systemd(UnixService):
             self.enable(svc_opts.service_name)
 
     def remove(self, svc_opts: UnixServiceOpts, force: bool = False):
-        service_fqn = self.to_service_fqn(svc_opts.service_dir, svc_opts.service_name)
-        self.stop(svc_opts.service_name)
-        self.disable(svc_opts.service_name)
-        if force and FileHelper.is_exists(service_fqn):
-            logger.info(f'Remove System service [{svc_opts.service_name}]...')
-            FileHelper.rm(service_fqn)
-        SystemHelper.exec_command("systemctl daemon-reload", silent=True, log_lvl=logger.INFO)
+        logger.info(f'Remove System service [{svc_opts.service_name}]...')
+        cleanup = f'rm -f {svc_opts.service_fqn}; ' if force else ''
+        SystemHelper.exec_command(f'systemctl disable --now {svc_opts.service_name}; '
+                                  f'{cleanup}systemctl daemon-reload', shell=True, silent=True, log_lvl=logger.INFO)
 
     def enable(self, service_name: str):
         logger.info(f'Enable System service [{service_name}]...', )
@@ -741,19 +816,30 @@ class Systemd(UnixService):
         logger.info(f'Disable System service [{service_name}]...', )
         SystemHelper.exec_command(f"systemctl disable {service_name}", silent=True, log_lvl=logger.INFO)
 
+    __settle_until = 0.0
+
     def stop(self, service_name):
+        self._await_settle()
         logger.info(f"Stop System service [{service_name}]...")
         SystemHelper.exec_command(f"systemctl stop {service_name}", silent=True, log_lvl=logger.INFO)
 
     def restart(self, service_name, delay: int = 1):
+        self._await_settle()
         logger.info(f"Restart System service [{service_name}]...")
         SystemHelper.exec_command(f"systemctl restart {service_name}", log_lvl=logger.INFO)
-        time.sleep(delay)
+        self.__settle_until = time.monotonic() + delay
+
+    def _await_settle(self):
+        """Sleep out the remainder of a pending settle window lazily instead of blocking right after a restart"""
+        remaining = self.__settle_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
 
     def status(self, service_name: str) -> ServiceStatus:
-        status = SystemHelper.exec_command(f"systemctl status {service_name} | grep Active | awk '{{print $2$3}}'",
-                                           shell=True, silent=True, log_lvl=logger.TRACE)
-        return ServiceStatus.parse(status)
+        output = SystemHelper.exec_command(f'systemctl show -p ActiveState,SubState {service_name}', silent=True,
+                                           log_lvl=logger.TRACE)
+        props = dict(kv.split('=', 1) for kv in (output or '').splitlines() if '=' in kv)
+        return ServiceStatus.parse(f'{props.get("ActiveState", "")}({props.get("SubState", "")})')
 
     def to_service_fqn(self, service_dir: str, service_name: str):
         return os.path.join(service_dir, f'{service_name}.service')
@@ -766,7 +852,9 @@ class Procd(UnixService, ABC):
 
     @staticmethod
     def factory(resource_dir: Union[str, Path], runtime_dir: Union[str, Path]) -> 'UnixService':
-        if SystemHelper.verify_command(f'pidof {UnixServiceType.PROCD.value}'):
+        init = SystemHelper.init_process_name()
+        if init == UnixServiceType.PROCD.value or \
+                (not init and SystemHelper.verify_command(f'pidof {UnixServiceType.PROCD.value}')):
             raise NotImplementedError('Not yet supported OpenWRT')
         return None
 
@@ -791,16 +879,14 @@ class DHCPResolver(IPResolver):
     def create_config(self, vpn_acc: str, replacements: dict):
         config_file = self._to_config_file(vpn_acc)
         logger.log(self.log_lvl, f'Create DHCP client VPN config[{config_file}]...')
-        FileHelper.copy(self.resource_dir.joinpath(self.DHCLIENT_CONFIG_TMPL), config_file, force=True)
-        FileHelper.replace_in_file(config_file, replacements, backup='')
-        FileHelper.chmod(config_file, mode=0o0644)
+        FileHelper.create_from_template(self.resource_dir.joinpath(self.DHCLIENT_CONFIG_TMPL), config_file,
+                                        replacements, mode=0o0644, log_lvl=logger.down_lvl(self.log_lvl))
 
     def add_hook(self, service_name: str, replacements: dict):
         exit_hook_file = self._to_hook_file(service_name)
         logger.log(self.log_lvl, f'Create DHCP client VPN hook[{exit_hook_file}]...')
-        FileHelper.copy(self.resource_dir.joinpath(self.DHCLIENT_EXIT_HOOK_TMPL), exit_hook_file, force=True)
-        FileHelper.replace_in_file(exit_hook_file, replacements, backup='')
-        FileHelper.chmod(exit_hook_file, mode=0o0744)
+        FileHelper.create_from_template(self.resource_dir.joinpath(self.DHCLIENT_EXIT_HOOK_TMPL), exit_hook_file,
+                                        replacements, mode=0o0744, log_lvl=logger.down_lvl(self.log_lvl))
 
     def remove_hook(self, service_name: str):
         exit_hook_file = self._to_hook_file(service_name)
@@ -860,24 +946,41 @@ class DeviceResolver:
         self.__service = None
         self.__ip_resolver = None
         self.__dns_resolver = None
+        self.__resource_dir = None
+        self.__runtime_dir = None
+        self.__log_lvl = logger.DEBUG
+        self.__silent = True
 
     def probe(self, resource_dir: Union[str, Path], runtime_dir: Union[str, Path], log_lvl=logger.DEBUG,
               silent=True) -> 'DeviceResolver':
-        self._service(Systemd.factory(resource_dir, runtime_dir) or Procd.factory(resource_dir, runtime_dir))
-        self._ip_resolver(DHCPResolver.factory(resource_dir, runtime_dir, log_lvl, silent))
-        self._dns_resolver(DNSResolver(resource_dir, runtime_dir, self.unix_service).probe())
+        """
+        Record probe parameters. Each resolver runs its detection lazily on first access so commands
+        that touch only a subset of resolvers skip the unrelated probing work
+        """
+        self.__resource_dir = Path(resource_dir)
+        self.__runtime_dir = Path(runtime_dir)
+        self.__log_lvl = log_lvl
+        self.__silent = silent
         return self
 
     @property
     def unix_service(self) -> UnixService:
+        if self.__service is None and self.__resource_dir is not None:
+            self._service(Systemd.factory(self.__resource_dir, self.__runtime_dir) or
+                          Procd.factory(self.__resource_dir, self.__runtime_dir))
         return self.__service
 
     @property
     def ip_resolver(self) -> IPResolver:
+        if self.__ip_resolver is None and self.__resource_dir is not None:
+            self._ip_resolver(
+                DHCPResolver.factory(self.__resource_dir, self.__runtime_dir, self.__log_lvl, self.__silent))
         return self.__ip_resolver
 
     @property
     def dns_resolver(self) -> DNSResolver:
+        if self.__dns_resolver is None and self.__resource_dir is not None:
+            self._dns_resolver(DNSResolver(self.__resource_dir, self.__runtime_dir, self.unix_service).probe())
         return self.__dns_resolver
 
     @property
@@ -898,7 +1001,7 @@ class DeviceResolver:
             logger.error('Unknown package manager. Please install [dnsmasq] by yourself')
             sys.exit(ErrorCode.MISSING_REQUIREMENT)
         pm.install('dnsmasq')
-        self._dns_resolver(self.dns_resolver.probe())
+        self._dns_resolver(self.dns_resolver.probe(force=True))
 
     def _service(self, service: UnixService):
         self.__service = self.__not_null(service, 'INIT system')
@@ -1,4 +1,5 @@
 import errno
+import functools
 import os
 import re
 import shutil
@@ -7,7 +8,7 @@ import socket
 import subprocess
 import sys
 from subprocess import CompletedProcess
-from typing import Union
+from typing import Sequence, Union
 
 from src.utils import logger as logger
 from src.utils.helper import DEFAULT_ENCODING, FileHelper, EnvHelper
@@ -74,12 +75,48 @@ class SystemHelper(object):
             logger.log(log_level, "+" * 40)
         raise RuntimeError()
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def init_process_name() -> str:
+        """Name of PID 1 (systemd/init/procd), read once from /proc instead of forking pidof"""
+        try:
+            with open('/proc/1/comm') as fp:
+                return fp.read().strip()
+        except OSError:
+            return ''
+
+    @staticmethod
+    def pid_by_process(process_name: str, silent=True, log_lvl=logger.TRACE) -> list:
+        return SystemHelper.pid_by_patterns([process_name], log_lvl=log_lvl)
+
+    @staticmethod
+    def pid_by_patterns(patterns: Sequence[str], log_lvl=logger.TRACE) -> list:
+        """Scan the process table once and collect PIDs whose command line matches any of the given regexes"""
+        matchers = [re.compile(p) for p in patterns]
+        me, pids = str(os.getpid()), []
+        try:
+            entries = os.scandir('/proc')
+        except OSError:
+            return pids
+        with entries:
+            for entry in entries:
+                if not entry.name.isdigit() or entry.name == me:
+                    continue
+                try:
+                    with open(os.path.join(entry.path, 'cmdline'), 'rb') as fp:
+                        cmdline = fp.read().replace(b'\0', b' ').decode(DEFAULT_ENCODING, 'replace').strip()
+                except OSError:
+                    continue
+                if cmdline and any(m.search(cmdline) for m in matchers):
+                    pids.append(entry.name)
+        logger.log(log_lvl, 'PID matches %s: %s', patterns, pids)
+        return pids
+
     @staticmethod
     def kill_by_process(process_name: str, silent=True, log_lvl=logger.DEBUG):
-        pid = SystemHelper.exec_command(f"ps aux | grep -e '{process_name}' | awk '{{print $2}}'", shell=True,
-                                        silent=silent, log_lvl=logger.down_lvl(log_lvl))
+        pid = SystemHelper.pid_by_process(process_name, silent=silent, log_lvl=logger.down_lvl(log_lvl))
         if pid:
-            SystemHelper.kill_by_pid(pid.split('\n'), silent=silent, log_lvl=logger.down_lvl(log_lvl))
+            SystemHelper.kill_by_pid(pid, silent=silent, log_lvl=logger.down_lvl(log_lvl))
 
     @staticmethod
     def kill_by_pid(pid: list, _signal=signal.SIGTERM, silent=True, log_lvl=logger.DEBUG):
@@ -1,4 +1,6 @@
+import os
 import sys
+import tempfile
 from abc import ABC, abstractmethod
 from typing import Union, Sequence, Dict
 
@@ -37,6 +39,9 @@ class VpnCmdExecutor(ABC):
     def vpn_cmd_opt(self):
         pass
 
+    def vpn_batch_opt(self):
+        return self.vpn_cmd_opt().replace('/CMD', '/IN')
+
     @abstractmethod
     def pre_exec(self, silent=False, log_lvl=logger.DEBUG, **kwargs):
         pass
@@ -53,6 +58,36 @@ class VpnCmdExecutor(ABC):
         finally:
             self.post_exec(silent, logger.down_lvl(log_lvl), **kwargs)
 
+    def exec_batch(self, commands: Sequence[str], silent=False, log_lvl=logger.DEBUG, **kwargs):
+        """
+        Execute many fully-formed VPN commands in one vpncmd session instead of one subprocess per command
+        """
+        try:
+            self.pre_exec(silent, logger.down_lvl(log_lvl), **kwargs)
+            return self._run_batch(commands, log_lvl, silent)
+        finally:
+            self.post_exec(silent, logger.down_lvl(log_lvl), **kwargs)
+
+    def _run_batch(self, commands: Sequence[str], log_lvl, silent):
+        if not self.is_installed(silent):
+            return None
+        commands = [c for c in commands or [] if c]
+        if not commands:
+            return ''
+        logger.decrease(log_lvl, f"Execute [{len(commands)}] VPN Commands in one session")
+        fd, script = tempfile.mkstemp(prefix='vpncmd-', suffix='.in', text=True)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write('\n'.join(commands) + '\n')
+            output = SystemHelper.exec_command(f'{self.opts.vpncmd} {self.vpn_batch_opt()}:{script}', silent=silent,
+                                               log_lvl=logger.down_lvl(log_lvl))
+        finally:
+            os.remove(script)
+        output = self._optimize_command_result(output)
+        logger.log(log_lvl, output)
+        logger.sep(logger.down_lvl(log_lvl))
+        return output
+
     def _run(self, commands, log_lvl, params, silent):
         if not self.is_installed(silent):
             return None
@@ -1,6 +1,8 @@
 import base64
 import collections
+import ctypes
 import fileinput
+import functools
 import glob
 import json
 import os
@@ -12,8 +14,8 @@ import stat
 import sys
 import tempfile
 import time
+import zipfile
 from datetime import datetime
-from distutils.dir_util import copy_tree
 from itertools import islice
 from json import JSONDecodeError
 from pathlib import Path
@@ -22,9 +24,36 @@ from typing import Sequence, Union, Any, Optional, Iterator, TextIO, Callable, N
 import src.utils.logger as logger
 from src.utils.constants import ErrorCode
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 DEFAULT_ENCODING = "UTF-8"
 PY_VERSION = platform.sys.version_info
 
+try:
+    cached_property = functools.cached_property
+except AttributeError:
+    class cached_property:
+        """Compat with Python < 3.8: compute once then store on the instance"""
+
+        def __init__(self, func):
+            self.func = func
+            functools.update_wrapper(self, func)
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = self.func(instance)
+            instance.__dict__[self.func.__name__] = value
+            return value
+
 
 class EnvHelper:
 
@@ -65,6 +94,7 @@ class EnvHelper:
         return Path(os.path.dirname(__file__)).parent.joinpath('debug')
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def build_executable_command():
         executable = sys.executable
         if getattr(sys, 'frozen', False):
@@ -74,6 +104,7 @@ class EnvHelper:
         return os.getcwd(), f'{executable} {" ".join(params)}'
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def binary_name():
         executable = sys.executable
         if getattr(sys, 'frozen', False):
@@ -113,6 +144,22 @@ class FileHelper:
             fp.write(content)
             os.chmod(p, mode)
 
+    @staticmethod
+    def write_file_atomic(path: Union[str, Path], content: str, mode=0o0644, log_lvl=logger.DEBUG):
+        """
+        Write a whole file then atomically rename it onto the target, so concurrent readers/writers
+        never observe a torn or partially written file. No lock is needed since os.replace is atomic
+        """
+        p = Path(path)
+        tmp = p.parent.joinpath(f'{p.name}.tmp.{os.getpid()}')
+        logger.log(log_lvl, f"Dump to file [{p}]")
+        with open(str(tmp.absolute()), 'w') as fp:
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmp, mode)
+        os.replace(str(tmp), str(p.absolute()))
+
     @staticmethod
     def write_binary_file(path: Union[str, Path], content, mode=0o0755, symlink: Union[str, Path] = None):
         p = Path(path)
@@ -235,8 +282,28 @@ class FileHelper:
                 print(line, end='')
         return has_replaced
 
+    @staticmethod
+    def create_from_template(template: Union[str, Path], dest: Union[str, Path], replacements: dict, mode=0o0644,
+                             log_lvl=logger.DEBUG):
+        """Render a template into dest with one read and one atomic write instead of copy+rewrite+chmod.
+        An existing dest with identical rendered content is left untouched, preserving its inode and mtime"""
+        content = FileHelper.read_file_by_line(template)
+        if content is None:
+            raise RuntimeError(f'Given template[{template}] is not existed')
+        for k, v in (replacements or {}).items():
+            content = content.replace(k, str(v))
+        if content == FileHelper.read_file_by_line(dest):
+            logger.log(log_lvl, f'Skip re-rendering [{dest}]: content is unchanged')
+            return content
+        FileHelper.write_file_atomic(dest, content, mode=mode, log_lvl=log_lvl)
+        return content
+
     @staticmethod
     def unpack_archive(file: str, dest: str):
+        if zipfile.is_zipfile(file):
+            with zipfile.ZipFile(file) as zf:
+                zf.extractall(dest)
+            return
         shutil.unpack_archive(file, dest)
 
     @staticmethod
@@ -266,9 +333,46 @@ class FileHelper:
                 FileHelper.rm(t)
             FileHelper.mkdirs(t.parent)
         if p.is_dir():
-            copy_tree(str(p.absolute()), str(t.absolute()))
+            FileHelper._copy_dir_fast(p.absolute(), t.absolute())
         else:
-            shutil.copy(p, t)
+            FileHelper._copy_file_fast(str(p), str(t.joinpath(p.name)) if t.is_dir() else str(t))
+
+    FICLONE = 0x40049409
+
+    @staticmethod
+    def _copy_file_fast(src: str, dest: str):
+        """Copy one file kernel-side when possible: reflink first, then copy_file_range, then userspace fallback"""
+        with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+            if fcntl:
+                try:
+                    fcntl.ioctl(fout.fileno(), FileHelper.FICLONE, fin.fileno())
+                    shutil.copymode(src, dest)
+                    return
+                except OSError:
+                    pass
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    while os.copy_file_range(fin.fileno(), fout.fileno(), 1 << 24):
+                        pass
+                    shutil.copymode(src, dest)
+                    return
+                except OSError:
+                    fin.seek(0)
+                    fout.seek(0)
+                    fout.truncate()
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        shutil.copymode(src, dest)
+
+    @staticmethod
+    def _copy_dir_fast(src: Path, dest: Path):
+        FileHelper.mkdirs(dest)
+        with os.scandir(src) as entries:
+            for entry in entries:
+                target = dest.joinpath(entry.name)
+                if entry.is_dir():
+                    FileHelper._copy_dir_fast(Path(entry.path), target)
+                else:
+                    FileHelper._copy_file_fast(entry.path, str(target))
 
     @staticmethod
     def copy_advanced(src: Union[str, Path], dest: Union[str, Path], force=False) -> str:
@@ -339,15 +443,42 @@ class FileHelper:
         with open(file, 'r') as fp:
             interval = 0.2
             fp.seek(0, os.SEEK_END)
-            while True:
-                rd = fp.read()
-                cur = fp.tell()
-                if not rd or cur == _pos:
-                    time.sleep(interval)
-                    fp.seek(_pos - cur, os.SEEK_SET)
-                else:
-                    _pos = cur
-                    yield rd
+            notify_fd = FileHelper.__watch_modify(file)
+            try:
+                while True:
+                    rd = fp.read()
+                    cur = fp.tell()
+                    if not rd or cur == _pos:
+                        if notify_fd is not None:
+                            os.read(notify_fd, 4096)
+                        else:
+                            time.sleep(interval)
+                        fp.seek(_pos - cur, os.SEEK_SET)
+                    else:
+                        _pos = cur
+                        yield rd
+            finally:
+                if notify_fd is not None:
+                    os.close(notify_fd)
+
+    IN_MODIFY, IN_DELETE_SELF, IN_MOVE_SELF = 0x2, 0x400, 0x800
+
+    @staticmethod
+    def __watch_modify(file: str) -> Optional[int]:
+        """Open an inotify fd on the given file so the follow loop can block on changes instead of polling.
+        Returns None when inotify is unavailable and the caller should fall back to sleep polling"""
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(0)
+            if fd < 0:
+                return None
+            mask = FileHelper.IN_MODIFY | FileHelper.IN_DELETE_SELF | FileHelper.IN_MOVE_SELF
+            if libc.inotify_add_watch(fd, os.fsencode(file), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
 
     @staticmethod
     def tree(dir_path: Union[str, Path], level: int = -1, limit_to_directories: bool = False,
@@ -403,6 +534,9 @@ class JsonHelper:
                 return _serialize(_d.__dict__)
             return _d
 
+        if orjson:
+            return orjson.dumps(_data, default=_serialize,
+                                option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode(DEFAULT_ENCODING)
         if isinstance(_data, object):
             return json.dumps(_data, default=lambda o: _serialize(o), sort_keys=True, indent=2)
         if isinstance(_data, collections.Sequence):
@@ -412,7 +546,7 @@ class JsonHelper:
     @staticmethod
     def dump(path: Union[str, Path], data: Any, mode=0o0644):
         logger.debug(f'Dump json to file [{path}]')
-        FileHelper.write_file(path, JsonHelper.to_json(data), mode, log_lvl=logger.TRACE)
+        FileHelper.write_file_atomic(path, JsonHelper.to_json(data), mode, log_lvl=logger.TRACE)
 
     @staticmethod
     def read(path: Union[str, Path], strict=True):
@@ -427,8 +561,8 @@ class JsonHelper:
             return _error(path, strict)
         with open(str(Path(path).absolute())) as fp:
             try:
-                return json.load(fp)
-            except (JSONDecodeError, TypeError) as err:
+                return orjson.loads(fp.read()) if orjson else json.load(fp)
+            except (JSONDecodeError, TypeError, ValueError) as err:
                 return _error(path, strict)
 
 
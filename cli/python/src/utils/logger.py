@@ -43,6 +43,11 @@ def down_lvl(level):
     return level - 1
 
 
+def is_enabled(level) -> bool:
+    """Check a log level is emitted under the current verbosity, to skip building expensive log arguments"""
+    return level >= LEVEL
+
+
 def decrease(level, message, *args):
     """
     Log with decrease log level to lower
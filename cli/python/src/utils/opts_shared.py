@@ -7,7 +7,7 @@ from functools import partial
 import click
 
 from src.utils import logger
-from src.utils.helper import EnvHelper
+from src.utils.helper import EnvHelper, cached_property
 
 CLI_CTX_SETTINGS = dict(help_option_names=["-h", "--help"], max_content_width=120)
 click.option = partial(click.option, show_default=True)
@@ -72,6 +72,10 @@ class UnixServiceOpts:
         self.service_dir = service_dir
         self.service_name = service_name
 
+    @cached_property
+    def service_fqn(self) -> str:
+        return os.path.join(self.service_dir, f'{self.service_name}.service')
+
 
 def unix_service_opts(service_name: str):
     def _inner(func):